@@ -1,21 +1,75 @@
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import time
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, and_, bindparam, func, tuple_
 from pydantic import BaseModel
+import orjson
+from fastapi_cache.decorator import cache
 
-from app.models.database import get_db
+from app.models.database import get_db, SessionLocal
 from app.models.case import Case
 from app.models.user import User
 from app.api.auth.router import get_current_user
+from app.core.cache import invalidate_case_cache
 from app.core.security import encryption
 
 
 router = APIRouter(prefix="/cases", tags=["Cases"])
 
+# Seconds a cached case response stays valid; writes invalidate it sooner
+CASE_CACHE_EXPIRE = 30
+
+# Rows fetched from the database per round trip while streaming case lists
+CASE_STREAM_BATCH_SIZE = 100
+
+# Statements are built once and executed with bound parameters so SQLAlchemy's
+# compiled-statement cache is hit on every request
+_CASE_OWNED_BY_USER = and_(Case.id == bindparam("cid"), Case.user_id == bindparam("uid"))
+
+_CASE_BY_ID_USER_STMT = select(Case).where(_CASE_OWNED_BY_USER)
+
+
+@lru_cache(maxsize=1)
+def _case_analyzable_stmt():
+    """Build analyze_case's ownership and "has documents" check.
+    
+    Built on first use because Case.documents.any() configures every mapper,
+    which needs all relationship targets imported; the task loads the documents.
+    """
+    return select(
+        Case.id,
+        Case.documents.any().label("has_documents")
+    ).where(_CASE_OWNED_BY_USER)
+
+
+@lru_cache(maxsize=None)
+def _list_cases_stmt(has_status: bool, has_cursor: bool):
+    """Build the list_cases query for a combination of optional filters."""
+    query = select(Case).where(Case.user_id == bindparam("uid"))
+    
+    if has_status:
+        query = query.where(Case.status == bindparam("status"))
+    
+    if has_cursor:
+        query = query.where(
+            tuple_(Case.created_at, Case.id)
+            < tuple_(bindparam("cursor_created_at"), bindparam("cursor_id"))
+        )
+    
+    return (
+        query.order_by(Case.created_at.desc(), Case.id.desc())
+        .limit(bindparam("limit"))
+        .execution_options(yield_per=CASE_STREAM_BATCH_SIZE)
+    )
+
 
 class CaseCreate(BaseModel):
     case_name: str
@@ -49,6 +103,66 @@ class CaseResponse(BaseModel):
         from_attributes = True
 
 
+class CaseCursor(BaseModel):
+    created_at: datetime
+    id: int
+
+
+class CaseListResponse(BaseModel):
+    items: List[CaseResponse]
+    next_cursor: Optional[CaseCursor] = None
+
+
+def case_cache_key_builder(
+    func,
+    namespace: str = "",
+    *,
+    request=None,
+    response=None,
+    args=(),
+    kwargs=None
+) -> str:
+    """Build a per-user cache key from an endpoint's parameters.
+    
+    The session and user objects are new on every request, so they are left
+    out of the hash and the user id is used as the key's namespace instead.
+    """
+    kwargs = kwargs or {}
+    params = sorted(
+        (name, value) for name, value in kwargs.items()
+        if name not in ("db", "current_user")
+    )
+    digest = hashlib.md5(f"{func.__name__}:{params}".encode()).hexdigest()
+    return f"{namespace}:{kwargs['current_user'].id}:{digest}"
+
+
+def _generate_case_number() -> str:
+    """Generate a unique case number stamped with the current UTC year."""
+    return f"FCN-{time.gmtime().tm_year}-{uuid.uuid4().hex[:8].upper()}"
+
+
+async def _stream_case_list(db: AsyncSession, result, limit: int) -> AsyncIterator[bytes]:
+    """Stream a CaseListResponse JSON body, serializing one row at a time."""
+    try:
+        yield b'{"items":['
+        count = 0
+        last = None
+        async for case in result:
+            if count:
+                yield b","
+            yield orjson.dumps(CaseResponse.model_validate(case).model_dump())
+            count += 1
+            last = case
+        
+        next_cursor = None
+        if last is not None and count == limit:
+            next_cursor = {"created_at": last.created_at, "id": last.id}
+        
+        yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b"}"
+    finally:
+        await db.close()
+
+
 @router.post("/", response_model=CaseResponse)
 async def create_case(
     case_data: CaseCreate,
@@ -56,12 +170,9 @@ async def create_case(
     db: AsyncSession = Depends(get_db)
 ):
     """Create a new case."""
-    # Generate unique case number
-    case_number = f"FCN-{datetime.now().year}-{uuid.uuid4().hex[:8].upper()}"
-    
     case = Case(
         user_id=current_user.id,
-        case_number=case_number,
+        case_number=_generate_case_number(),
         case_name=case_data.case_name,
         client_name=case_data.client_name,
         opposing_party=case_data.opposing_party,
@@ -71,41 +182,71 @@ async def create_case(
     db.add(case)
     await db.commit()
     await db.refresh(case)
+    await invalidate_case_cache(current_user.id)
     
     return case
 
 
-@router.get("/", response_model=List[CaseResponse])
+@router.get("/", response_model=CaseListResponse)
 async def list_cases(
     status: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
-    """List all cases for the current user."""
-    query = select(Case).where(Case.user_id == current_user.id)
+    cursor_created_at: Optional[datetime] = None,
+    cursor_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+) -> StreamingResponse:
+    """List cases for the current user, newest first.
+    
+    Uses keyset pagination: pass the previous page's ``next_cursor`` back as
+    ``cursor_created_at``/``cursor_id`` to fetch the following page. Rows are
+    streamed to the client as they are read.
+    """
+    if (cursor_created_at is None) != (cursor_id is None):
+        # `status` is shadowed by the query parameter in this handler
+        raise HTTPException(
+            status_code=400,
+            detail="cursor_created_at and cursor_id must be provided together"
+        )
+    
+    params = {"uid": current_user.id, "limit": limit}
     
     if status:
-        query = query.where(Case.status == status)
+        params["status"] = status
+    
+    if cursor_id is not None:
+        params["cursor_created_at"] = cursor_created_at
+        params["cursor_id"] = cursor_id
     
-    query = query.offset(skip).limit(limit).order_by(Case.created_at.desc())
+    query = _list_cases_stmt(bool(status), cursor_id is not None)
     
-    result = await db.execute(query)
-    cases = result.scalars().all()
+    # The stream outlives the request's dependencies, so it owns its session.
+    # Run the query before responding so database errors still surface as a
+    # proper error status instead of a truncated 200.
+    db = SessionLocal()
+    try:
+        result = await db.stream_scalars(query, params)
+    except BaseException:
+        await db.close()
+        raise
     
-    return cases
+    return StreamingResponse(
+        _stream_case_list(db, result, limit),
+        media_type="application/json",
+        # Also covers a client that disconnects before the body is iterated
+        background=BackgroundTask(db.close)
+    )
 
 
 @router.get("/{case_id}", response_model=CaseResponse)
+@cache(expire=CASE_CACHE_EXPIRE, namespace="cases", key_builder=case_cache_key_builder)
 async def get_case(
     case_id: int,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
-):
+) -> CaseResponse:
     """Get a specific case."""
     result = await db.execute(
-        select(Case).where(and_(Case.id == case_id, Case.user_id == current_user.id))
+        _CASE_BY_ID_USER_STMT, {"cid": case_id, "uid": current_user.id}
     )
     case = result.scalar_one_or_none()
     
@@ -115,7 +256,7 @@ async def get_case(
             detail="Case not found"
         )
     
-    return case
+    return CaseResponse.model_validate(case)
 
 
 @router.put("/{case_id}", response_model=CaseResponse)
@@ -126,8 +267,16 @@ async def update_case(
     db: AsyncSession = Depends(get_db)
 ):
     """Update a case."""
+    update_data = case_update.dict(exclude_unset=True)
+    
+    # Single UPDATE ... RETURNING instead of SELECT, mutate, COMMIT, REFRESH
     result = await db.execute(
-        select(Case).where(and_(Case.id == case_id, Case.user_id == current_user.id))
+        update(Case)
+        .where(_CASE_OWNED_BY_USER)
+        .values(**update_data, updated_at=func.now())
+        .returning(Case)
+        .execution_options(synchronize_session=False),
+        {"cid": case_id, "uid": current_user.id}
     )
     case = result.scalar_one_or_none()
     
@@ -137,17 +286,13 @@ async def update_case(
             detail="Case not found"
         )
     
-    # Update fields
-    update_data = case_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(case, field, value)
-    
-    case.updated_at = datetime.utcnow()
+    # Serialize before commit expires the returned row
+    response = CaseResponse.model_validate(case)
     
     await db.commit()
-    await db.refresh(case)
+    await invalidate_case_cache(current_user.id)
     
-    return case
+    return response
 
 
 @router.delete("/{case_id}")
@@ -158,7 +303,7 @@ async def delete_case(
 ):
     """Delete a case and all associated data."""
     result = await db.execute(
-        select(Case).where(and_(Case.id == case_id, Case.user_id == current_user.id))
+        _CASE_BY_ID_USER_STMT, {"cid": case_id, "uid": current_user.id}
     )
     case = result.scalar_one_or_none()
     
@@ -168,24 +313,29 @@ async def delete_case(
             detail="Case not found"
         )
     
-    # Delete case (cascade will handle documents and reports)
+    # Delete through the ORM so relationship cascades remove documents and reports
     await db.delete(case)
     await db.commit()
+    await invalidate_case_cache(current_user.id)
     
     return {"message": "Case deleted successfully"}
 
 
-@router.post("/{case_id}/analyze")
+@router.post("/{case_id}/analyze", status_code=status.HTTP_202_ACCEPTED)
 async def analyze_case(
     case_id: int,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Trigger AI analysis for a case."""
+    """Trigger AI analysis for a case.
+    
+    Only ownership and the presence of documents are checked here; the task
+    loads the case documents itself so the request returns immediately.
+    """
     result = await db.execute(
-        select(Case).where(and_(Case.id == case_id, Case.user_id == current_user.id))
+        _case_analyzable_stmt(), {"cid": case_id, "uid": current_user.id}
     )
-    case = result.scalar_one_or_none()
+    case = result.one_or_none()
     
     if not case:
         raise HTTPException(
@@ -194,41 +344,26 @@ async def analyze_case(
         )
     
     # Check if case has documents
-    if not case.documents:
+    if not case.has_documents:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No documents uploaded for this case"
         )
     
-    # Import the enhanced forensic service
-    from app.services.ai_agent_v3 import forensic_service_v3
-    from app.services.email import send_case_completion_email
-    from celery import current_app as celery_app
-    
-    # Get case documents
-    documents_data = []
-    for doc in case.documents:
-        doc_data = {
-            'id': str(doc.id),
-            'type': doc.file_type,
-            'filename': doc.original_filename,
-            'status': doc.status,
-            'extracted_data': doc.extracted_data or {}
-        }
-        documents_data.append(doc_data)
-    
-    # Trigger async analysis
+    from app.tasks import celery_app
+    
+    # Trigger async analysis on the configured app; send_task publishes over
+    # the app's broker connection pool
     task = celery_app.send_task(
         'app.tasks.analyze_case_task',
         args=[
             case_id,
-            documents_data,
             {
                 'user_id': current_user.id,
                 'email': current_user.email,
                 'full_name': current_user.full_name
             },
-            case.jurisdiction or current_user.jurisdiction or 'California'
+            current_user.jurisdiction or 'California'
         ]
     )
     
@@ -0,0 +1,48 @@
+from functools import lru_cache
+import logging
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "falcon-cache"
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> aioredis.Redis:
+    """Return the process-wide Redis client."""
+    return aioredis.from_url(settings.REDIS_URL)
+
+
+def init_cache() -> None:
+    """Initialize the API response cache. Call once from the FastAPI lifespan."""
+    FastAPICache.init(RedisBackend(get_redis()), prefix=CACHE_PREFIX)
+
+
+async def clear_namespace(namespace: str) -> None:
+    """Delete cached responses under a namespace without going through FastAPICache.
+
+    Works whether or not init_cache has run, so Celery workers can use it too.
+    """
+    redis = get_redis()
+    keys = [key async for key in redis.scan_iter(match=f"{CACHE_PREFIX}:{namespace}:*")]
+    if keys:
+        await redis.delete(*keys)
+
+
+async def invalidate_case_cache(user_id: int) -> None:
+    """Drop every cached case response for a user.
+
+    Called after the change is committed, so a cache outage is logged rather
+    than failing the request or task; entries still expire on their own.
+    """
+    try:
+        await clear_namespace(f"cases:{user_id}")
+    except RedisError:
+        logger.warning("Could not clear cached cases for user %d", user_id, exc_info=True)
@@ -0,0 +1,41 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import logging
+import queue
+import sys
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: Optional[int] = None) -> None:
+    """Route root logging through a queue so emitting never blocks the caller.
+
+    The handlers already on the root logger (e.g. the ones Celery installs,
+    including --logfile) are moved behind a background QueueListener, so
+    records keep their configured destinations and format. Safe to call more
+    than once per process; only the first call installs the queue.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    if not handlers:
+        # Write to the real stderr: sys.stderr may be a proxy that logs back to root
+        stream_handler = logging.StreamHandler(sys.__stderr__)
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+        handlers = [stream_handler]
+    
+    log_queue: queue.Queue = queue.Queue(-1)
+    root.handlers[:] = [QueueHandler(log_queue)]
+    if level is not None:
+        root.setLevel(level)
+    
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,70 +1,306 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from email.policy import compat32
+from email.utils import parseaddr
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
 import asyncio
+import logging
+import time
 from datetime import timedelta
+from string import Template
+import html
+
+import aiosmtplib
 
 from app.core.config import settings
 from app.core.security import create_access_token
 
 
-async def send_email(
+logger = logging.getLogger(__name__)
+
+# Settings read on every send, resolved once at import
+_BASE_URL = settings.CORS_ORIGINS[0]
+_SMTP_CONFIG = (
+    settings.SMTP_HOST,
+    settings.SMTP_PORT,
+    settings.SMTP_USERNAME,
+    settings.SMTP_PASSWORD,
+    settings.FROM_EMAIL,
+)
+_SENDER_ADDRESS = parseaddr(settings.FROM_EMAIL)[1]
+
+# Connections kept open per SMTP server, and messages sent on one connection
+# before it is closed and replaced
+SMTP_POOL_SIZE = 5
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+
+
+@dataclass
+class _PooledSMTP:
+    server: aiosmtplib.SMTP
+    messages_sent: int = 0
+
+
+async def _close_quietly(server: aiosmtplib.SMTP) -> None:
+    """Close an SMTP connection, ignoring errors from an already dead socket."""
+    try:
+        await server.quit()
+    except (aiosmtplib.SMTPException, OSError):
+        server.close()
+
+
+async def _is_alive(server: aiosmtplib.SMTP) -> bool:
+    """Check an idle connection with NOOP before reusing it."""
+    try:
+        return (await server.noop()).code == 250
+    except (aiosmtplib.SMTPException, OSError):
+        return False
+
+
+class SMTPConnectionPool:
+    """Bounded pool of authenticated SMTP connections to one server."""
+    
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        size: int = SMTP_POOL_SIZE,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_messages = max_messages
+        self._idle: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self._slots = asyncio.Semaphore(size)
+    
+    async def _connect(self) -> aiosmtplib.SMTP:
+        server = aiosmtplib.SMTP(hostname=self.host, port=self.port, start_tls=False)
+        await server.connect()
+        try:
+            await server.starttls()
+            await server.login(self.username, self.password)
+        except BaseException:
+            server.close()
+            raise
+        return server
+    
+    async def acquire(self) -> _PooledSMTP:
+        """Take a live connection from the pool, opening one if none is idle."""
+        await self._slots.acquire()
+        try:
+            while not self._idle.empty():
+                conn = self._idle.get_nowait()
+                if await _is_alive(conn.server):
+                    return conn
+                conn.server.close()
+            
+            return _PooledSMTP(await self._connect())
+        except BaseException:
+            self._slots.release()
+            raise
+    
+    async def release(self, conn: _PooledSMTP, discard: bool = False) -> None:
+        """Return a connection, closing it if broken or past its message limit."""
+        try:
+            if discard or conn.messages_sent >= self.max_messages:
+                await _close_quietly(conn.server)
+            else:
+                self._idle.put_nowait(conn)
+        finally:
+            self._slots.release()
+    
+    async def close(self) -> None:
+        """Close every idle connection."""
+        while not self._idle.empty():
+            await _close_quietly(self._idle.get_nowait().server)
+
+
+_smtp_pools: Dict[Tuple[str, int, str, str, str], SMTPConnectionPool] = {}
+
+
+def _get_smtp_pool() -> SMTPConnectionPool:
+    """Return the connection pool for the configured SMTP server."""
+    pool = _smtp_pools.get(_SMTP_CONFIG)
+    if pool is None:
+        host, port, username, password, _ = _SMTP_CONFIG
+        pool = _smtp_pools[_SMTP_CONFIG] = SMTPConnectionPool(host, port, username, password)
+    return pool
+
+
+async def close_smtp_pools() -> None:
+    """Close all pooled SMTP connections. Await from the application's shutdown hook."""
+    for pool in _smtp_pools.values():
+        await pool.close()
+
+
+# MIME classes build compat32 messages; flatten them with SMTP line endings
+_WIRE_POLICY = compat32.clone(linesep="\r\n")
+
+# Stands in for the recipient in shared renders; swapped for the real address per send
+_TO_PLACEHOLDER = "falcon-recipient-placeholder"
+
+
+def _build_message(
     to_email: str,
     subject: str,
     body: str,
-    html_body: Optional[str] = None
-) -> bool:
-    """Send email using SMTP."""
+    html_body: Optional[str]
+) -> bytes:
+    """Build and serialize a message for one recipient."""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = _SMTP_CONFIG[4]
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    
+    # Add plain text part
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Add HTML part if provided
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html'))
+    
+    return msg.as_bytes(policy=_WIRE_POLICY)
+
+
+@lru_cache(maxsize=128)
+def _render_shared_message(subject: str, body: str, html_body: Optional[str]) -> bytes:
+    """Serialize content sent to several recipients once, addressed to the placeholder."""
+    return _build_message(_TO_PLACEHOLDER, subject, body, html_body)
+
+
+def _address_shared_message(
+    to_email: str,
+    subject: str,
+    body: str,
+    html_body: Optional[str]
+) -> bytes:
+    """Address a cached shared render to one recipient."""
+    # The address is spliced into bytes, bypassing the email package's header checks
+    if "\r" in to_email or "\n" in to_email:
+        raise ValueError(f"Invalid recipient address: {to_email!r}")
+    return _render_shared_message(subject, body, html_body).replace(
+        _TO_PLACEHOLDER.encode(), to_email.encode(), 1
+    )
+
+
+async def _deliver(to_email: str, render: Callable[[], bytes]) -> bool:
+    """Render and send one message, logging instead of raising on failure."""
     try:
-        msg = MIMEMultipart('alternative')
-        msg['From'] = settings.FROM_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add plain text part
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Add HTML part if provided
-        if html_body:
-            msg.attach(MIMEText(html_body, 'html'))
-        
-        # Send email in a thread to avoid blocking
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, _send_smtp_email, msg)
-        
+        await _send_smtp_email(to_email, render())
         return True
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+    except Exception:
+        logger.exception("Failed to send email to %s", to_email)
         return False
 
 
-def _send_smtp_email(msg: MIMEMultipart):
-    """Synchronous SMTP email sending."""
-    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-        server.starttls()
-        server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-        server.send_message(msg)
+async def send_email(
+    to_email: str,
+    subject: str,
+    body: str,
+    html_body: Optional[str] = None
+) -> bool:
+    """Send email using SMTP."""
+    return await _deliver(
+        to_email, lambda: _build_message(to_email, subject, body, html_body)
+    )
+
 
+async def send_email_bulk(
+    messages: List[Tuple[str, str, str, Optional[str]]]
+) -> List[bool]:
+    """Send (to_email, subject, body, html_body) messages concurrently.
 
-async def send_verification_email(email: str, full_name: str) -> bool:
-    """Send email verification link."""
-    # Create verification token
-    token = create_access_token(
-        data={"email": email, "type": "email_verification"},
-        expires_delta=timedelta(hours=24)
-    )
+    At most one send per pooled connection is in flight, so a large batch
+    queues on the pool instead of opening a burst of SMTP handshakes. Content
+    shared by several recipients is serialized once.
+    """
+    semaphore = asyncio.Semaphore(SMTP_POOL_SIZE)
     
-    verification_url = f"{settings.CORS_ORIGINS[0]}/verify-email/{token}"
+    async def _send_one(message: Tuple[str, str, str, Optional[str]]) -> bool:
+        async with semaphore:
+            return await _deliver(message[0], lambda: _address_shared_message(*message))
     
-    subject = "Verify your Falcon account"
+    return await asyncio.gather(*(_send_one(message) for message in messages))
+
+
+async def _send_smtp_email(to_email: str, message: bytes) -> None:
+    """Send a serialized message over a pooled SMTP connection."""
+    pool = _get_smtp_pool()
     
-    body = f"""
-Hello {full_name},
+    # A pooled connection can still be dropped by the server between the
+    # health check and the send; retry that case once on a fresh connection
+    for attempt in range(2):
+        conn = await pool.acquire()
+        try:
+            await conn.server.sendmail(_SENDER_ADDRESS, [to_email], message)
+        except aiosmtplib.SMTPServerDisconnected:
+            await pool.release(conn, discard=True)
+            if attempt:
+                raise
+            continue
+        except BaseException:
+            await pool.release(conn, discard=True)
+            raise
+        
+        conn.messages_sent += 1
+        await pool.release(conn)
+        return
+
+
+# Lifetime of the signed links embedded in each kind of email
+TOKEN_LIFETIMES = {
+    "email_verification": timedelta(hours=24),
+    "password_reset": timedelta(hours=1),
+}
+
+
+@lru_cache(maxsize=2048)
+def _cached_token(email: str, type_: str, bucket: int) -> str:
+    """Sign a token once per (email, type, minute) so rapid resends reuse it."""
+    return create_access_token(
+        data={"email": email, "type": type_},
+        expires_delta=TOKEN_LIFETIMES[type_]
+    )
+
+
+# Styles shared by every HTML email, plus per-email additions
+_BASE_CSS = (
+    "body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }"
+    ".container { max-width: 600px; margin: 0 auto; padding: 20px; }"
+    ".header { color: white; padding: 20px; text-align: center; }"
+    ".content { background-color: #f7f7f7; padding: 30px; margin-top: 20px; }"
+    ".button { display: inline-block; padding: 12px 24px; background-color: #2563eb; color: white; text-decoration: none; border-radius: 5px; margin-top: 20px; }"
+)
+_ACCOUNT_CSS = ".header { background-color: #1a365d; }"
+_WARN_CSS = (
+    _ACCOUNT_CSS
+    + ".warning { background-color: #fef3c7; border-left: 4px solid #f59e0b; padding: 15px; margin-top: 20px; }"
+)
+_ERROR_CSS = (
+    ".header { background-color: #d32f2f; }"
+    ".error-box { background-color: #ffebee; border-left: 4px solid #d32f2f; padding: 15px; margin: 20px 0; }"
+)
+_SUCCESS_CSS = (
+    ".header { background-color: #1976d2; }"
+    ".button { background-color: #1976d2; }"
+    ".summary-box { background-color: #e3f2fd; padding: 20px; border-radius: 5px; margin: 20px 0; }"
+    ".reports-list { background-color: white; padding: 15px; border-radius: 5px; margin: 20px 0; }"
+)
+
+
+# Email templates are parsed once at import; HTML substitutions are escaped by callers
+_VERIFY_TEXT_TMPL = Template("""
+Hello $full_name,
 
 Welcome to Falcon! Please verify your email address by clicking the link below:
 
-{verification_url}
+$verification_url
 
 This link will expire in 24 hours.
 
@@ -72,19 +308,13 @@ If you didn't create this account, please ignore this email.
 
 Best regards,
 The Falcon Team
-"""
-    
-    html_body = f"""
+""")
+
+_VERIFY_HTML_TMPL = Template(f"""
 <!DOCTYPE html>
 <html>
 <head>
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background-color: #1a365d; color: white; padding: 20px; text-align: center; }}
-        .content {{ background-color: #f7f7f7; padding: 30px; margin-top: 20px; }}
-        .button {{ display: inline-block; padding: 12px 24px; background-color: #2563eb; color: white; text-decoration: none; border-radius: 5px; margin-top: 20px; }}
-    </style>
+    <style>{_BASE_CSS}{_ACCOUNT_CSS}</style>
 </head>
 <body>
     <div class="container">
@@ -92,9 +322,9 @@ The Falcon Team
             <h1>Welcome to Falcon</h1>
         </div>
         <div class="content">
-            <h2>Hello {full_name},</h2>
+            <h2>Hello $full_name,</h2>
             <p>Thank you for registering with Falcon. Please verify your email address to complete your registration.</p>
-            <a href="{verification_url}" class="button">Verify Email Address</a>
+            <a href="$verification_url" class="button">Verify Email Address</a>
             <p style="margin-top: 30px; font-size: 14px; color: #666;">
                 This link will expire in 24 hours. If you didn't create this account, please ignore this email.
             </p>
@@ -102,29 +332,14 @@ The Falcon Team
     </div>
 </body>
 </html>
-"""
-    
-    return await send_email(email, subject, body, html_body)
+""")
 
-
-async def send_password_reset_email(email: str, full_name: str) -> bool:
-    """Send password reset link."""
-    # Create reset token
-    token = create_access_token(
-        data={"email": email, "type": "password_reset"},
-        expires_delta=timedelta(hours=1)
-    )
-    
-    reset_url = f"{settings.CORS_ORIGINS[0]}/reset-password/{token}"
-    
-    subject = "Reset your Falcon password"
-    
-    body = f"""
-Hello {full_name},
+_RESET_TEXT_TMPL = Template("""
+Hello $full_name,
 
 You requested to reset your password. Click the link below to set a new password:
 
-{reset_url}
+$reset_url
 
 This link will expire in 1 hour.
 
@@ -132,20 +347,13 @@ If you didn't request this, please ignore this email. Your password won't be cha
 
 Best regards,
 The Falcon Team
-"""
-    
-    html_body = f"""
+""")
+
+_RESET_HTML_TMPL = Template(f"""
 <!DOCTYPE html>
 <html>
 <head>
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background-color: #1a365d; color: white; padding: 20px; text-align: center; }}
-        .content {{ background-color: #f7f7f7; padding: 30px; margin-top: 20px; }}
-        .button {{ display: inline-block; padding: 12px 24px; background-color: #2563eb; color: white; text-decoration: none; border-radius: 5px; margin-top: 20px; }}
-        .warning {{ background-color: #fef3c7; border-left: 4px solid #f59e0b; padding: 15px; margin-top: 20px; }}
-    </style>
+    <style>{_BASE_CSS}{_WARN_CSS}</style>
 </head>
 <body>
     <div class="container">
@@ -153,9 +361,9 @@ The Falcon Team
             <h1>Password Reset Request</h1>
         </div>
         <div class="content">
-            <h2>Hello {full_name},</h2>
+            <h2>Hello $full_name,</h2>
             <p>You requested to reset your password for your Falcon account.</p>
-            <a href="{reset_url}" class="button">Reset Password</a>
+            <a href="$reset_url" class="button">Reset Password</a>
             <div class="warning">
                 <strong>Security Notice:</strong> This link will expire in 1 hour. If you didn't request this password reset, please ignore this email and your password will remain unchanged.
             </div>
@@ -163,45 +371,26 @@ The Falcon Team
     </div>
 </body>
 </html>
-"""
-    
-    return await send_email(email, subject, body, html_body)
+""")
 
+_CASE_ERROR_TEXT_TMPL = Template("""
+Hello $user_name,
 
-async def send_case_completion_email(
-    to_email: str,
-    user_name: str,
-    case_id: int,
-    summary: str,
-    confidence_level: str,
-    is_error: bool = False
-) -> bool:
-    """Send notification when case analysis is complete."""
-    if is_error:
-        subject = f"Falcon Alert: Analysis Failed for Case #{case_id}"
-        body = f"""
-Hello {user_name},
+Unfortunately, the forensic analysis for Case #$case_id has encountered an error:
 
-Unfortunately, the forensic analysis for Case #{case_id} has encountered an error:
-
-Error: {summary}
+Error: $summary
 
 Our team has been notified and will investigate this issue. Please try again later or contact support if the problem persists.
 
 Best regards,
 The Falcon Team
-"""
-        html_body = f"""
+""")
+
+_CASE_ERROR_HTML_TMPL = Template(f"""
 <!DOCTYPE html>
 <html>
 <head>
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background-color: #d32f2f; color: white; padding: 20px; text-align: center; }}
-        .content {{ background-color: #f7f7f7; padding: 30px; margin-top: 20px; }}
-        .error-box {{ background-color: #ffebee; border-left: 4px solid #d32f2f; padding: 15px; margin: 20px 0; }}
-    </style>
+    <style>{_BASE_CSS}{_ERROR_CSS}</style>
 </head>
 <body>
     <div class="container">
@@ -209,28 +398,27 @@ The Falcon Team
             <h1>Analysis Failed</h1>
         </div>
         <div class="content">
-            <h2>Hello {user_name},</h2>
-            <p>Unfortunately, the forensic analysis for Case #{case_id} has encountered an error:</p>
+            <h2>Hello $user_name,</h2>
+            <p>Unfortunately, the forensic analysis for Case #$case_id has encountered an error:</p>
             <div class="error-box">
-                <strong>Error:</strong> {summary}
+                <strong>Error:</strong> $summary
             </div>
             <p>Our team has been notified and will investigate this issue. Please try again later or contact support if the problem persists.</p>
         </div>
     </div>
 </body>
 </html>
-"""
-    else:
-        subject = f"Falcon Analysis Complete: Case #{case_id}"
-        body = f"""
-Hello {user_name},
+""")
+
+_CASE_SUCCESS_TEXT_TMPL = Template("""
+Hello $user_name,
 
-The comprehensive forensic analysis for Case #{case_id} has been completed successfully.
+The comprehensive forensic analysis for Case #$case_id has been completed successfully.
 
-Overall Confidence Level: {confidence_level}
+Overall Confidence Level: $confidence_level
 
 Analysis Summary:
-{summary}
+$summary
 
 Available Reports:
 - Executive Summary Report
@@ -241,20 +429,13 @@ You can access all reports and detailed findings by logging into your Falcon das
 
 Best regards,
 The Falcon Team
-"""
-        html_body = f"""
+""")
+
+_CASE_SUCCESS_HTML_TMPL = Template(f"""
 <!DOCTYPE html>
 <html>
 <head>
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background-color: #1976d2; color: white; padding: 20px; text-align: center; }}
-        .content {{ background-color: #f7f7f7; padding: 30px; margin-top: 20px; }}
-        .summary-box {{ background-color: #e3f2fd; padding: 20px; border-radius: 5px; margin: 20px 0; }}
-        .button {{ display: inline-block; padding: 12px 24px; background-color: #1976d2; color: white; text-decoration: none; border-radius: 5px; margin-top: 20px; }}
-        .reports-list {{ background-color: white; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-    </style>
+    <style>{_BASE_CSS}{_SUCCESS_CSS}</style>
 </head>
 <body>
     <div class="container">
@@ -262,13 +443,13 @@ The Falcon Team
             <h1>Forensic Analysis Complete</h1>
         </div>
         <div class="content">
-            <h2>Hello {user_name},</h2>
-            <p>The comprehensive forensic analysis for Case #{case_id} has been completed successfully.</p>
+            <h2>Hello $user_name,</h2>
+            <p>The comprehensive forensic analysis for Case #$case_id has been completed successfully.</p>
             
             <div class="summary-box">
                 <h3>Analysis Summary</h3>
-                <p><strong>Overall Confidence Level:</strong> {confidence_level}</p>
-                <p>{summary}</p>
+                <p><strong>Overall Confidence Level:</strong> $confidence_level</p>
+                <p>$summary</p>
             </div>
             
             <div class="reports-list">
@@ -281,7 +462,7 @@ The Falcon Team
             </div>
             
             <center>
-                <a href="{settings.CORS_ORIGINS[0]}/cases/{case_id}" class="button">View Full Report</a>
+                <a href="$case_url" class="button">View Full Report</a>
             </center>
             
             <p style="margin-top: 30px; font-size: 12px; color: #666;">
@@ -292,6 +473,88 @@ The Falcon Team
     </div>
 </body>
 </html>
-"""
+""")
+
+
+async def send_verification_email(email: str, full_name: str) -> bool:
+    """Send email verification link."""
+    # Create verification token
+    token = _cached_token(email, "email_verification", int(time.time() // 60))
+    
+    verification_url = f"{_BASE_URL}/verify-email/{token}"
+    
+    subject = "Verify your Falcon account"
+    
+    body = _VERIFY_TEXT_TMPL.substitute(
+        full_name=full_name,
+        verification_url=verification_url
+    )
+    
+    html_body = _VERIFY_HTML_TMPL.substitute(
+        full_name=html.escape(full_name),
+        verification_url=verification_url
+    )
+    
+    return await send_email(email, subject, body, html_body)
+
+
+async def send_password_reset_email(email: str, full_name: str) -> bool:
+    """Send password reset link."""
+    # Create reset token
+    token = _cached_token(email, "password_reset", int(time.time() // 60))
+    
+    reset_url = f"{_BASE_URL}/reset-password/{token}"
+    
+    subject = "Reset your Falcon password"
     
-    return await send_email(to_email, subject, body, html_body)
\ No newline at end of file
+    body = _RESET_TEXT_TMPL.substitute(full_name=full_name, reset_url=reset_url)
+    
+    html_body = _RESET_HTML_TMPL.substitute(
+        full_name=html.escape(full_name),
+        reset_url=reset_url
+    )
+    
+    return await send_email(email, subject, body, html_body)
+
+
+async def send_case_completion_email(
+    to_emails: List[str],
+    user_name: str,
+    case_id: int,
+    summary: str,
+    confidence_level: str,
+    is_error: bool = False
+) -> bool:
+    """Send notification to each recipient when case analysis is complete."""
+    if is_error:
+        subject = f"Falcon Alert: Analysis Failed for Case #{case_id}"
+        body = _CASE_ERROR_TEXT_TMPL.substitute(
+            user_name=user_name,
+            case_id=case_id,
+            summary=summary
+        )
+        html_body = _CASE_ERROR_HTML_TMPL.substitute(
+            user_name=html.escape(user_name),
+            case_id=case_id,
+            summary=html.escape(summary)
+        )
+    else:
+        subject = f"Falcon Analysis Complete: Case #{case_id}"
+        body = _CASE_SUCCESS_TEXT_TMPL.substitute(
+            user_name=user_name,
+            case_id=case_id,
+            confidence_level=confidence_level,
+            summary=summary
+        )
+        html_body = _CASE_SUCCESS_HTML_TMPL.substitute(
+            user_name=html.escape(user_name),
+            case_id=case_id,
+            confidence_level=html.escape(confidence_level),
+            summary=html.escape(summary),
+            case_url=f"{_BASE_URL}/cases/{case_id}"
+        )
+    
+    results = await send_email_bulk(
+        [(to_email, subject, body, html_body) for to_email in to_emails]
+    )
+    return all(results)
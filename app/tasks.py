@@ -1,12 +1,23 @@
 from celery import Celery
-from datetime import datetime
-from typing import List, Dict, Any
+from celery.signals import worker_process_init
+from datetime import datetime, timezone
+import asyncio
+import logging
+import os
+from typing import List, Dict, Any, Optional, Tuple
 
+import orjson
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from app.core.cache import invalidate_case_cache
 from app.core.config import settings
+from app.core.logging_config import setup_logging
 from app.models.database import SessionLocal
 from app.models.case import Case
+from app.models.document import Document
 from app.models.report import Report
-from app.services.ai_agent_v3 import forensic_service_v3
 from app.services.email import send_case_completion_email
 
 # Initialize Celery
@@ -18,37 +29,197 @@ celery_app = Celery(
 
 # Configure Celery
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    # msgpack is smaller and faster than JSON; keep JSON accepted for messages already queued
+    task_serializer='msgpack',
+    accept_content=['msgpack', 'json'],
+    result_serializer='msgpack',
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
     task_time_limit=1800,  # 30 minutes
     task_soft_time_limit=1500,  # 25 minutes
+    # Analyses wait minutes on the LLM; size workers explicitly rather than by CPU count
+    worker_concurrency=int(os.getenv('CELERY_WORKER_CONCURRENCY', '8')),
+    # Only reserve a task when a process is free so long analyses don't queue behind each other
+    worker_prefetch_multiplier=1,
+    task_routes={
+        'app.tasks.analyze_case_task': {'queue': 'forensic'},
+    },
+    # Let API processes enqueue concurrently without waiting on broker connections
+    broker_pool_limit=50,
+    # Keep the visibility timeout above task_time_limit so running tasks are never redelivered
+    broker_transport_options={'visibility_timeout': 3600, 'socket_keepalive': True},
+    result_backend_transport_options={'socket_keepalive': True},
+    # Analysis results are large, repetitive JSON; compress them on the wire
+    task_compression='zstd',
+    result_compression='zstd',
 )
 
+logger = logging.getLogger(__name__)
+
+# Database engine owned by this worker process, set up by init_worker_db
+_worker_engine: Optional[AsyncEngine] = None
+_worker_sessionmaker: Optional[async_sessionmaker] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _json_default(obj: Any) -> Any:
+    """Encode the pandas values orjson rejects (Timestamp, NaT) in Excel previews."""
+    if obj != obj:
+        # NaT is the only such value that is not equal to itself
+        return None
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _json_serializer(obj: Any) -> str:
+    """Encode JSON/JSONB column values with orjson (asyncpg expects text)."""
+    # Spreadsheet stats are keyed by column labels, which may be ints or dates
+    return orjson.dumps(
+        obj,
+        default=_json_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    ).decode()
+
+
+@worker_process_init.connect
+def init_worker_db(**kwargs) -> None:
+    """Create one persistent engine per worker process for all its tasks."""
+    global _worker_engine, _worker_sessionmaker
+    
+    setup_logging()
+    
+    # A worker process runs one task at a time, so one connection is enough;
+    # pre-ping replaces connections the database dropped between tasks
+    _worker_engine = create_async_engine(
+        settings.DATABASE_URL,
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True,
+        json_serializer=_json_serializer,
+        json_deserializer=orjson.loads
+    )
+    _worker_sessionmaker = async_sessionmaker(_worker_engine, expire_on_commit=False)
+
+
+def _run_async(coro):
+    """Run a coroutine on this process's event loop, creating it on first use.
+
+    The loop is kept for the life of the process rather than using
+    asyncio.run per task, so the worker engine, Redis client and SMTP pool,
+    which bind to the loop they first connect on, stay usable across tasks.
+    """
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    
+    task = _worker_loop.create_task(coro)
+    try:
+        return _worker_loop.run_until_complete(task)
+    except BaseException:
+        # Something raised into the loop itself (e.g. Celery's soft time limit
+        # signal) and left the task suspended. Cancel it and let it unwind here
+        # so its cleanup runs now rather than inside the next task.
+        if not task.done():
+            task.cancel()
+            try:
+                _worker_loop.run_until_complete(task)
+            except BaseException:
+                pass
+        raise
+
+
+def worker_session() -> AsyncSession:
+    """Open a session on the worker's engine (the app's SessionLocal outside workers)."""
+    if _worker_sessionmaker is None:
+        return SessionLocal()
+    return _worker_sessionmaker()
+
+
+async def _load_case_documents(
+    case_id: int,
+    user_id: int
+) -> Optional[Tuple[Optional[str], List[Dict[str, Any]]]]:
+    """
+    Load a case's jurisdiction and document payload in two queries.
+    
+    Returns:
+        (jurisdiction, documents_data), or None if the user has no such case
+    """
+    
+    async with worker_session() as db:
+        result = await db.execute(
+            select(Case)
+            .options(
+                selectinload(Case.documents).load_only(
+                    Document.id,
+                    Document.file_type,
+                    Document.original_filename,
+                    Document.status,
+                    Document.extracted_data
+                )
+            )
+            .where(Case.id == case_id, Case.user_id == user_id)
+        )
+        case = result.scalar_one_or_none()
+        
+        if case is None:
+            return None
+        
+        documents_data = [
+            {
+                'id': str(doc.id),
+                'type': doc.file_type,
+                'filename': doc.original_filename,
+                'status': doc.status,
+                'extracted_data': doc.extracted_data or {}
+            }
+            for doc in case.documents
+        ]
+        return case.jurisdiction, documents_data
+
 
 @celery_app.task(name='app.tasks.analyze_case_task')
-async def analyze_case_task(
+def analyze_case_task(
     case_id: int,
-    documents_data: List[Dict[str, Any]],
     user_context: Dict[str, Any],
-    jurisdiction: str
+    default_jurisdiction: str
 ) -> Dict[str, Any]:
     """
-    Async task to perform comprehensive forensic analysis on a case.
+    Task to perform comprehensive forensic analysis on a case.
     
     Args:
         case_id: ID of the case to analyze
-        documents_data: List of document data dictionaries
         user_context: User context information
-        jurisdiction: Legal jurisdiction for the case
+        default_jurisdiction: Jurisdiction to use when the case has none set
     
     Returns:
         Analysis results dictionary
     """
+    return _run_async(_analyze_case_async(case_id, user_context, default_jurisdiction))
+
+
+async def _analyze_case_async(
+    case_id: int,
+    user_context: Dict[str, Any],
+    default_jurisdiction: str
+) -> Dict[str, Any]:
+    """Run the forensic analysis for a case and store its reports."""
     try:
+        # Building the service creates the model client, so config errors land here
+        from app.services.ai_agent_v3 import get_forensic_service
+        forensic_service_v3 = get_forensic_service()
+        
+        loaded = await _load_case_documents(case_id, user_context['user_id'])
+        if loaded is None:
+            # Case was deleted (or never belonged to this user) after queueing
+            return {"status": "not_found", "case_id": case_id}
+        
+        case_jurisdiction, documents_data = loaded
+        jurisdiction = case_jurisdiction or default_jurisdiction
+        
         # Run the Falcon v3.0 forensic analysis
         analysis_result = await forensic_service_v3.analyze_case(
             case_id=case_id,
@@ -56,38 +227,32 @@ async def analyze_case_task(
             user_context=user_context,
             jurisdiction=jurisdiction
         )
+        generated_at = datetime.now(timezone.utc).isoformat()
         
-        # Generate reports
-        executive_report = await forensic_service_v3.generate_report(
-            analysis_result, 
-            report_type="executive"
+        # Generate reports; they only read the analysis, so run them together
+        executive_report, confidence_report, detailed_report = await asyncio.gather(
+            forensic_service_v3.generate_report(analysis_result, report_type="executive"),
+            forensic_service_v3.generate_report(analysis_result, report_type="confidence"),
+            forensic_service_v3.generate_report(analysis_result, report_type="detailed")
         )
         
-        confidence_report = await forensic_service_v3.generate_report(
-            analysis_result,
-            report_type="confidence"
-        )
-        
-        detailed_report = await forensic_service_v3.generate_report(
-            analysis_result,
-            report_type="detailed"
-        )
+        # Dump once to JSON-safe types for both the report metadata and the task result
+        confidence_dashboard = analysis_result.confidence_dashboard.model_dump(mode='json')
         
         # Save reports to database
-        async with SessionLocal() as db:
+        async with worker_session() as db:
             # Create executive summary report
             exec_report = Report(
                 case_id=case_id,
                 report_type="executive_summary",
                 content=executive_report,
                 metadata={
-                    "confidence_dashboard": analysis_result.confidence_dashboard.dict(),
+                    "confidence_dashboard": confidence_dashboard,
                     "total_assets": analysis_result.total_assets_value,
                     "net_worth": analysis_result.net_worth,
-                    "generated_at": datetime.utcnow().isoformat()
+                    "generated_at": generated_at
                 }
             )
-            db.add(exec_report)
             
             # Create confidence analysis report
             conf_report = Report(
@@ -100,7 +265,6 @@ async def analyze_case_task(
                     "objectivity_assessment": analysis_result.objectivity_assessment
                 }
             )
-            db.add(conf_report)
             
             # Create detailed forensic report
             detail_report = Report(
@@ -114,21 +278,30 @@ async def analyze_case_task(
                     "immediate_actions_count": len(analysis_result.immediate_actions)
                 }
             )
-            db.add(detail_report)
             
-            # Update case status
-            case = await db.get(Case, case_id)
-            if case:
-                case.status = "analysis_complete"
-                case.total_assets = analysis_result.total_assets_value
-                case.total_liabilities = analysis_result.total_liabilities_amount
-                case.updated_at = datetime.utcnow()
+            db.add_all([exec_report, conf_report, detail_report])
+            
+            # Update case status without loading the row first
+            result = await db.execute(
+                update(Case)
+                .where(Case.id == case_id)
+                .values(
+                    status="analysis_complete",
+                    total_assets=analysis_result.total_assets_value,
+                    total_liabilities=analysis_result.total_liabilities_amount,
+                    updated_at=func.now()
+                )
+            )
+            if result.rowcount == 0:
+                logger.warning("Case %d not found when marking analysis complete", case_id)
             
             await db.commit()
         
+        await invalidate_case_cache(user_context['user_id'])
+        
         # Send completion email
         await send_case_completion_email(
-            to_email=user_context['email'],
+            to_emails=[user_context['email']],
             user_name=user_context['full_name'],
             case_id=case_id,
             summary=analysis_result.executive_summary,
@@ -139,28 +312,34 @@ async def analyze_case_task(
             "status": "completed",
             "case_id": case_id,
             "reports_generated": ["executive", "confidence", "detailed"],
-            "confidence_dashboard": analysis_result.confidence_dashboard.dict(),
+            "confidence_dashboard": confidence_dashboard,
             "total_assets": analysis_result.total_assets_value,
             "net_worth": analysis_result.net_worth,
             "immediate_actions": len(analysis_result.immediate_actions),
             "strategic_leverage_points": len(analysis_result.strategic_leverage_points)
         }
         
-    except Exception as e:
-        # Log the error
-        print(f"Error analyzing case {case_id}: {str(e)}")
+    except (Exception, asyncio.CancelledError) as e:
+        # CancelledError arrives when _run_async unwinds a task interrupted by a
+        # time limit; the case still has to be marked failed
+        logger.exception("Error analyzing case %d", case_id)
         
         # Update case status to failed
-        async with SessionLocal() as db:
-            case = await db.get(Case, case_id)
-            if case:
-                case.status = "analysis_failed"
-                case.updated_at = datetime.utcnow()
-                await db.commit()
+        async with worker_session() as db:
+            result = await db.execute(
+                update(Case)
+                .where(Case.id == case_id)
+                .values(status="analysis_failed", updated_at=func.now())
+            )
+            if result.rowcount == 0:
+                logger.warning("Case %d not found when marking analysis failed", case_id)
+            await db.commit()
+        
+        await invalidate_case_cache(user_context['user_id'])
         
         # Send failure notification
         await send_case_completion_email(
-            to_email=user_context['email'],
+            to_emails=[user_context['email']],
             user_name=user_context['full_name'],
             case_id=case_id,
             summary=f"Analysis failed: {str(e)}",
@@ -171,77 +350,204 @@ async def analyze_case_task(
         raise
 
 
+def _extract_pdf(file_path: str) -> Dict[str, Any]:
+    """Extract text and metadata from a PDF."""
+    import pypdf
+    with open(file_path, 'rb') as file:
+        # strict=False tolerates minor structural errors in scanned statements
+        pdf_reader = pypdf.PdfReader(file, strict=False)
+        text_content = "".join(
+            page.extract_text() or "" for page in pdf_reader.pages
+        )
+        
+        return {
+            "text_content": text_content,
+            "page_count": len(pdf_reader.pages),
+            # pypdf metadata values are PDF objects; store them as plain strings
+            "metadata": {k: str(v) for k, v in (pdf_reader.metadata or {}).items()}
+        }
+
+
+def _read_csv_table(file_path: str):
+    """Read a CSV into an Arrow table, or return None if Arrow cannot parse it."""
+    # Arrow's multithreaded C++ parser is much faster than pandas on large statements
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    try:
+        return pacsv.read_csv(
+            file_path,
+            read_options=pacsv.ReadOptions(block_size=8 << 20)
+        )
+    except pa.ArrowInvalid:
+        # Arrow fixes column types from the first block, so exports with
+        # formatted amounts or footer rows further down are rejected
+        logger.info("Falling back to pandas for CSV %s", file_path, exc_info=True)
+        return None
+
+
+def _read_excel(file_path: str):
+    """Read an Excel workbook's first sheet into a DataFrame."""
+    import pandas as pd
+    return pd.read_excel(file_path, engine="calamine")
+
+
+def _read_dataframe(file_path: str, file_type: str):
+    """Read a spreadsheet into a DataFrame."""
+    import pandas as pd
+    if file_type != 'csv':
+        return _read_excel(file_path)
+    
+    table = _read_csv_table(file_path)
+    if table is None:
+        return pd.read_csv(file_path)
+    # Keep datetimes as plain Python objects rather than pd.Timestamp so the
+    # preview can be written to JSON
+    return table.to_pandas(timestamp_as_object=True)
+
+
+def _extract_spreadsheet(file_path: str, file_type: str) -> Dict[str, Any]:
+    """Extract the row count, columns and column types from a spreadsheet."""
+    if file_type == 'csv':
+        table = _read_csv_table(file_path)
+        if table is not None:
+            return {
+                "row_count": table.num_rows,
+                "columns": table.column_names,
+                "schema": {field.name: str(field.type) for field in table.schema}
+            }
+        
+        import pandas as pd
+        df = pd.read_csv(file_path)
+    else:
+        df = _read_excel(file_path)
+    
+    return {
+        "row_count": len(df),
+        "columns": df.columns.tolist(),
+        "schema": {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+    }
+
+
+def _compute_spreadsheet_stats(file_path: str, file_type: str) -> Dict[str, Any]:
+    """Compute summary statistics and a preview for a spreadsheet."""
+    df = _read_dataframe(file_path, file_type)
+    
+    return {
+        "summary_stats": df.describe().to_dict() if not df.empty else {},
+        "data_preview": df.head(10).to_dict(orient="list") if not df.empty else {}
+    }
+
+
 @celery_app.task(name='app.tasks.process_document_task')
-async def process_document_task(
+def process_document_task(
     document_id: int,
     file_path: str,
-    file_type: str
+    file_type: str,
+    compute_stats: bool = False
 ) -> Dict[str, Any]:
     """
-    Async task to process and extract data from uploaded documents.
+    Task to process and extract data from uploaded documents.
     
     Args:
         document_id: ID of the document to process
         file_path: Path to the uploaded file
         file_type: Type of document (pdf, excel, csv, etc.)
+        compute_stats: Queue compute_dataset_stats_task for spreadsheets
     
     Returns:
-        Extraction results dictionary
+        Status dictionary; the extracted data is stored on the document
     """
+    return _run_async(
+        _process_document_async(document_id, file_path, file_type, compute_stats)
+    )
+
+
+async def _process_document_async(
+    document_id: int,
+    file_path: str,
+    file_type: str,
+    compute_stats: bool
+) -> Dict[str, Any]:
+    """Extract data from an uploaded document and record it on the document."""
     try:
         extracted_data = {}
         
+        # Parsing is blocking, so keep it off the event loop
         if file_type == 'pdf':
-            # Extract text from PDF
-            import pypdf
-            with open(file_path, 'rb') as file:
-                pdf_reader = pypdf.PdfReader(file)
-                text_content = ""
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text()
-                
-                extracted_data = {
-                    "text_content": text_content,
-                    "page_count": len(pdf_reader.pages),
-                    "metadata": pdf_reader.metadata
-                }
+            extracted_data = await asyncio.to_thread(_extract_pdf, file_path)
         
         elif file_type in ['csv', 'xlsx', 'xls']:
-            # Extract data from spreadsheet
-            import pandas as pd
-            df = pd.read_csv(file_path) if file_type == 'csv' else pd.read_excel(file_path)
-            
-            extracted_data = {
-                "row_count": len(df),
-                "columns": df.columns.tolist(),
-                "summary_stats": df.describe().to_dict() if not df.empty else {},
-                "data_preview": df.head(10).to_dict() if not df.empty else {}
-            }
+            extracted_data = await asyncio.to_thread(_extract_spreadsheet, file_path, file_type)
         
         # Update document status in database
-        async with SessionLocal() as db:
-            from app.models.document import Document
+        async with worker_session() as db:
             document = await db.get(Document, document_id)
             if document:
                 document.status = "processed"
                 document.extracted_data = extracted_data
-                document.processed_at = datetime.utcnow()
+                document.processed_at = func.now()
                 await db.commit()
         
-        return {
-            "status": "success",
-            "document_id": document_id,
-            "extracted_data": extracted_data
-        }
+        # Statistics scan every row, so they are computed separately on request
+        if compute_stats and file_type in ['csv', 'xlsx', 'xls']:
+            compute_dataset_stats_task.delay(document_id, file_path, file_type)
+        
+        # The extracted data lives on the document row; previews can hold dates
+        # that the msgpack result serializer cannot encode
+        return {"status": "success", "document_id": document_id}
+        
+    except (Exception, asyncio.CancelledError) as e:
+        logger.exception("Error processing document %d", document_id)
         
-    except Exception as e:
         # Update document status to failed
-        async with SessionLocal() as db:
-            from app.models.document import Document
+        async with worker_session() as db:
             document = await db.get(Document, document_id)
             if document:
                 document.status = "processing_failed"
                 document.error_message = str(e)
                 await db.commit()
         
-        raise
\ No newline at end of file
+        raise
+
+
+@celery_app.task(name='app.tasks.compute_dataset_stats_task')
+def compute_dataset_stats_task(
+    document_id: int,
+    file_path: str,
+    file_type: str
+) -> Dict[str, Any]:
+    """
+    Task to compute summary statistics and a preview for a processed spreadsheet.
+    
+    Args:
+        document_id: ID of the document
+        file_path: Path to the uploaded file
+        file_type: Type of spreadsheet (csv, xlsx, xls)
+    
+    Returns:
+        Status dictionary; the statistics are stored on the document
+    """
+    return _run_async(_compute_dataset_stats_async(document_id, file_path, file_type))
+
+
+async def _compute_dataset_stats_async(
+    document_id: int,
+    file_path: str,
+    file_type: str
+) -> Dict[str, Any]:
+    """Compute spreadsheet statistics and merge them into the document's extracted data."""
+    try:
+        stats = await asyncio.to_thread(_compute_spreadsheet_stats, file_path, file_type)
+        
+        async with worker_session() as db:
+            document = await db.get(Document, document_id)
+            if document:
+                # Reassign rather than mutate so the JSON column change is detected
+                document.extracted_data = {**(document.extracted_data or {}), **stats}
+                await db.commit()
+        
+        return {"status": "success", "document_id": document_id}
+        
+    except Exception:
+        logger.exception("Error computing statistics for document %d", document_id)
+        raise